@@ -1,7 +1,9 @@
 import streamlit as st
+import io
 import os
-import tempfile
-import pdfplumber
+import concurrent.futures
+import fitz  # PyMuPDF
+from blake3 import blake3
 from markitdown import MarkItDown
 
 # --- Page Configuration ---
@@ -45,53 +47,167 @@ def main():
         st.divider()
         st.subheader("Processed Documents")
 
-        md = MarkItDown()
+        # Submit conversions to a background thread pool so the rerun does
+        # not block until every file is parsed; the threads just marshal
+        # work to the process pool via the cached converter.
+        # setdefault would build (and discard) a fresh executor every rerun,
+        # so guard the construction explicitly.
+        if "conversion_pool" not in st.session_state:
+            st.session_state["conversion_pool"] = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        pool = st.session_state["conversion_pool"]
+        jobs = st.session_state.setdefault("conversion_jobs", {})
 
+        batch = []
         for uploaded_file in uploaded_files:
-            with st.container():
-                process_file(uploaded_file, md)
-                st.divider()
+            filename_no_ext, file_ext = os.path.splitext(uploaded_file.name)
+            suffix = file_ext.lower()
+            data = uploaded_file.getvalue()
+            # Match _convert_cached's cache key: identical bytes under
+            # different extensions must not share a future.
+            key = (blake3(data).hexdigest(), suffix)
+            if key not in jobs:
+                jobs[key] = pool.submit(_convert_cached, data, suffix)
+            batch.append((key, uploaded_file, filename_no_ext))
 
-def process_file(uploaded_file, md_engine):
-    original_filename = uploaded_file.name
-    filename_no_ext, file_ext = os.path.splitext(original_filename)
-    
-    # Calculate Original Size
-    original_size_bytes = uploaded_file.size
-    
-    # Create temp file
-    tmp_file_path = None
-    try:
-        suffix = file_ext.lower()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
+        # Drop jobs for files removed from the uploader: finished futures
+        # pin the full converted text in session state, and st.cache_data
+        # already retains results (with eviction) for any re-upload.
+        active_keys = {key for key, _, _ in batch}
+        for stale_key in [k for k in jobs if k not in active_keys]:
+            del jobs[stale_key]
+
+        # Only poll while conversions are still running; once everything is
+        # done, render statically so idle sessions stop re-running at 2 Hz.
+        if all(jobs[key].done() for key, _, _ in batch):
+            _render_batch(batch)
+        else:
+            _poll_batch(batch)
+
+@st.fragment(run_every=0.5)
+def _poll_batch(batch):
+    """Re-render every 0.5s until the batch finishes, then settle."""
+    _render_batch(batch)
+    jobs = st.session_state["conversion_jobs"]
+    if all(jobs[key].done() for key, _, _ in batch):
+        # One full rerun lands main() on the static path above.
+        st.rerun()
+
+def _render_batch(batch):
+    """Render each finished file in place, with placeholders for the rest."""
+    jobs = st.session_state["conversion_jobs"]
+    for key, uploaded_file, filename_no_ext in batch:
+        future = jobs[key]
+        with st.container():
+            if future.done():
+                success, text_content, error_details = future.result()
+                _render(uploaded_file, filename_no_ext, success, text_content, error_details)
+            else:
+                st.info(f"⏳ Converting **{uploaded_file.name}**...")
+            st.divider()
 
-        text_content = ""
-        conversion_success = False
-        error_details = ""
+# Per-process MarkItDown singleton. Conversion runs in pool workers, so this
+# amortizes plugin-registry construction across the files each worker handles.
+_MD_ENGINE = None
 
-        # --- Attempt 1: MarkItDown (Primary Engine) ---
+def _get_md_engine():
+    global _MD_ENGINE
+    if _MD_ENGINE is None:
+        _MD_ENGINE = MarkItDown()
+    return _MD_ENGINE
+
+@st.cache_resource
+def _get_executor():
+    """Process pool shared across reruns; parsing is CPU-bound."""
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(os.cpu_count() or 1, 4)
+    )
+
+# Formats that are already text: no parsing needed, just decode.
+# (.html is excluded on purpose; MarkItDown genuinely converts it to Markdown.)
+_TEXT_SUFFIXES = {'.txt', '.csv', '.json'}
+
+# The cache key is recomputed on every rerun, even on hits; BLAKE3's
+# SIMD implementation keeps that cheap for multi-MB uploads.
+@st.cache_data(show_spinner=False, hash_funcs={bytes: lambda b: blake3(b).digest()})
+def _convert_cached(data, suffix):
+    """Convert upload bytes, memoized on content so reruns skip re-parsing."""
+    if suffix in _TEXT_SUFFIXES:
+        return True, data.decode('utf-8', errors='replace'), ""
+    return _get_executor().submit(_convert_bytes, data, suffix).result()
+
+def _convert_bytes(data, suffix):
+    """Worker: convert raw upload bytes to Markdown text.
+
+    Runs in a worker process, so no Streamlit calls here. Returns
+    (success, text_content, error_details); success is explicit so a
+    legitimately empty document still counts as converted.
+    """
+    success = False
+    text_content = ""
+    error_details = ""
+
+    if suffix == '.pdf':
+        # --- PDFs: go straight to PyMuPDF instead of letting MarkItDown
+        # fail first and paying for the exception round-trip. ---
         try:
-            result = md_engine.convert(tmp_file_path)
+            # The "text" flag keeps paragraph boundaries and reading order.
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                # Probe the first page before walking the whole document:
+                # a scanned, image-only PDF has no extractable text anywhere,
+                # so don't pay for the remaining N-1 pages just to find out.
+                first = doc[0].get_text("text") if doc.page_count else ""
+                if first.strip():
+                    text_content = "\n\n".join(page.get_text("text") for page in doc)
+                    if text_content.strip():
+                        success = True
+                    else:
+                        text_content = ""
+                        error_details += "PyMuPDF failed: PDF appears empty.\n"
+                else:
+                    # Skip the full page walk, but fall through to the
+                    # fallback below: the first page may just be a cover
+                    # image on an otherwise-extractable document.
+                    error_details += "PyMuPDF failed: no extractable text on the first page. If the whole document is scanned (image-only), OCR is required.\n"
+        except Exception as e:
+            error_details += f"PyMuPDF failed: {str(e)}\n"
+
+        # --- Fallback: MarkItDown ---
+        if not success:
+            try:
+                result = _get_md_engine().convert_stream(io.BytesIO(data), file_extension=suffix)
+                text_content = result.text_content
+                # pdfminer "succeeds" vacuously on image-only PDFs; treat a
+                # blank result as failure so the OCR hint above is shown.
+                if text_content.strip():
+                    success = True
+                else:
+                    text_content = ""
+                    error_details += "Fallback failed: PDF appears empty.\n"
+            except Exception as fallback_e:
+                error_details += f"Fallback failed: {str(fallback_e)}\n"
+    else:
+        # --- Everything else: MarkItDown (Primary Engine) ---
+        try:
+            result = _get_md_engine().convert_stream(io.BytesIO(data), file_extension=suffix)
             text_content = result.text_content
-            conversion_success = True
+            success = True
         except Exception as e:
             error_details += f"MarkItDown failed: {str(e)}\n"
-            
-            # --- Attempt 2: PDF Fallback (pdfplumber) ---
-            if suffix == '.pdf':
-                try:
-                    with pdfplumber.open(tmp_file_path) as pdf:
-                        text_content = "\n\n".join([page.extract_text() or "" for page in pdf.pages])
-                    if text_content.strip():
-                        conversion_success = True
-                        original_filename += " (processed with Fallback Engine)"
-                    else:
-                        error_details += "Fallback failed: PDF appears empty.\n"
-                except Exception as fallback_e:
-                    error_details += f"Fallback failed: {str(fallback_e)}\n"
 
+    return success, text_content, error_details
+
+def _render(uploaded_file, filename_no_ext, conversion_success, text_content, error_details):
+    """Render the result of one conversion. All st.* calls live here."""
+    original_filename = uploaded_file.name
+
+    # Calculate Original Size
+    original_size_bytes = uploaded_file.size
+
+    if conversion_success and error_details:
+        # Text came back despite a primary-engine error: the fallback ran.
+        original_filename += " (processed with Fallback Engine)"
+
+    try:
         # --- Success Path ---
         if conversion_success:
             st.success(f"✅ Successfully converted: **{original_filename}**")
@@ -108,12 +224,16 @@ def process_file(uploaded_file, md_engine):
                     label_visibility="collapsed"
                 )
 
+                # Encode once; both download buttons share the same buffer
+                # instead of Streamlit pinning two encoded copies per session.
+                payload = text_content.encode('utf-8')
+
                 col1, col2 = st.columns(2)
                 new_filename_md = f"{filename_no_ext}_converted.md"
                 with col1:
                     st.download_button(
                         label="⬇️ Download Markdown",
-                        data=text_content,
+                        data=payload,
                         file_name=new_filename_md,
                         mime="text/markdown"
                     )
@@ -122,15 +242,15 @@ def process_file(uploaded_file, md_engine):
                 with col2:
                     st.download_button(
                         label="⬇️ Download Text File",
-                        data=text_content,
+                        data=payload,
                         file_name=new_filename_txt,
                         mime="text/plain"
                     )
 
             # --- TAB 2: File Size Comparison ---
             with tab2:
-                # Calculate Converted Size (approximate bytes of the text string)
-                converted_size_bytes = len(text_content.encode('utf-8'))
+                # Converted size comes free from the download payload above.
+                converted_size_bytes = len(payload)
                 
                 # Calculate Savings
                 if original_size_bytes > 0:
@@ -162,14 +282,6 @@ def process_file(uploaded_file, md_engine):
     except Exception as e:
         st.error(f"⚠️ System Error processing {original_filename}.")
         print(f"Critical Error: {e}")
-    
-    finally:
-        # Cleanup temp file
-        if tmp_file_path and os.path.exists(tmp_file_path):
-            try:
-                os.remove(tmp_file_path)
-            except Exception:
-                pass
 
 if __name__ == "__main__":
     main()